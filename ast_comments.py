@@ -1,16 +1,32 @@
+import array
 import ast
+import bisect
+import copy
 import re
 import sys
 import tokenize
 import typing as _t
 from ast import *  # noqa: F401,F403
-from collections.abc import Iterable
+from collections import OrderedDict
 
 
 class Comment(ast.AST):
     if sys.version_info >= (3, 10):
         __match_args__ = ("value", "inline")
+    # ast.AST instances otherwise carry a per-instance dict; comments can number in
+    # the thousands for large files, so store their attributes in slots instead
+    __slots__ = (
+        "value",
+        "inline",
+        "lineno",
+        "col_offset",
+        "end_lineno",
+        "end_col_offset",
+    )
     _attributes = ["lineno", "col_offset", "end_lineno", "end_col_offset"]
+    # class-level tag so sort comparators can order comments after statements
+    # without an isinstance check per comparison
+    _comment_tag = 1
     value: str
     inline: bool
     _fields = (
@@ -18,72 +34,99 @@ class Comment(ast.AST):
         "inline",
     )
 
+    # ast.AST.__reduce__ only carries the instance dict, which is empty for a
+    # slotted subclass; hand pickle/copy the slot values instead
+    def __reduce__(self):
+        state = {
+            name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)
+        }
+        return type(self), (), state
+
+    def __setstate__(self, state: _t.Dict[str, _t.Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+_CONTAINER_ATTRS = ("body", "handlers", "orelse", "finalbody")
 
-_CONTAINER_ATTRS = ["body", "handlers", "orelse", "finalbody"]
+# f-string literals may contain '#' inside replacement fields; sources that could
+# have one fall back to the full tokenizer in _extract_comments
+_FSTRING_RE = re.compile(r"[fF][rbRB]?['\"]|[rbRB][fF]['\"]")
 
 
-def parse(source: _t.Union[str, bytes, ast.AST], *args, **kwargs) -> ast.AST:
+# Callers like linters and formatters tend to re-parse identical sources; with
+# cache=True the enriched tree is computed once per source and handed out as a copy
+_parse_cache: "OrderedDict[str, ast.AST]" = OrderedDict()
+_PARSE_CACHE_MAXSIZE = 32
+
+
+def parse(
+    source: _t.Union[str, bytes, ast.AST], *args, cache: bool = False, **kwargs
+) -> ast.AST:
+    if cache and isinstance(source, str) and not args and not kwargs:
+        return _parse_cached(source)
     tree = ast.parse(source, *args, **kwargs)
     if isinstance(source, (str, bytes)):
         _enrich(source, tree)
     return tree
 
 
+def _parse_cached(source: str) -> ast.AST:
+    tree = _parse_cache.get(source)
+    if tree is None:
+        tree = ast.parse(source)
+        _enrich(source, tree)
+        _parse_cache[source] = tree
+        if len(_parse_cache) > _PARSE_CACHE_MAXSIZE:
+            _parse_cache.popitem(last=False)
+    else:
+        _parse_cache.move_to_end(source)
+    # Hand out a copy so mutations by the caller don't poison the cached tree
+    return copy.deepcopy(tree)
+
+
+def _parse_cache_clear() -> None:
+    _parse_cache.clear()
+
+
 def _enrich(source: _t.Union[str, bytes], tree: ast.AST) -> None:
+    # A source without a single '#' has no comments; for bytes input this also
+    # skips the decode
     if isinstance(source, bytes):
+        if b"#" not in source:
+            return
         source = source.decode()
-    lines_iter = iter(source.splitlines(keepends=True))
-    tokens = tokenize.generate_tokens(lambda: next(lines_iter))
-
-    comment_nodes = []
-    for t in tokens:
-        if t.type != tokenize.COMMENT:
-            continue
-        lineno, col_offset = t.start
-        end_lineno, end_col_offset = t.end
-        c = Comment(
-            value=t.string,
-            inline=t.string != t.line.strip("\n").lstrip(" "),
-            lineno=lineno,
-            col_offset=col_offset,
-            end_lineno=end_lineno,
-            end_col_offset=end_col_offset,
-        )
-        comment_nodes.append(c)
+    elif "#" not in source:
+        return
+    lines = source.split("\n")
+    # Insert an empty line to correspond to the lineno values from ast nodes which start at 1
+    # instead of 0
+    lines.insert(0, "")
 
+    comment_nodes = _extract_comments(source, lines)
     if not comment_nodes:
         return
 
-    tree_intervals = _get_tree_intervals_and_update_ast_nodes(tree, source)
-    for c_node in comment_nodes:
-        c_lineno = c_node.lineno
-        possible_intervals_for_c_node = [
-            (x, y) for x, y in tree_intervals if x <= c_lineno <= y
-        ]
-
-        if possible_intervals_for_c_node:
-            target_interval = tree_intervals[
-                max(possible_intervals_for_c_node, key=lambda item: (item[0], -item[1]))
-            ]
-
-            target_node = target_interval["node"]
-            # intervals for every attribute from _CONTAINER_ATTRS for the target node
-            sub_intervals = target_interval["intervals"]
-
-            loc = -1
-            for i, (low, high, _) in enumerate(sub_intervals):
-                if low <= c_lineno <= high or c_lineno < low:
-                    loc = i
-                    break
+    indents = array.array("i", [_compute_indent(line) for line in lines])
+    is_comment = bytearray(line.lstrip(" \t").startswith("#") for line in lines)
+    next_dedent = _compute_next_dedent(indents)
 
-            *_, target_attr = sub_intervals[loc]
+    bounds, records = _get_tree_intervals_and_update_ast_nodes(
+        tree, lines, indents, is_comment, next_dedent
+    )
+    pending: _t.Dict[_t.Tuple[int, str], _t.Tuple[ast.AST, str, _t.List[Comment]]] = {}
+    for c_node in comment_nodes:
+        target_node, target_attr = _find_target(c_node.lineno, tree, bounds, records)
+        key = (id(target_node), target_attr)
+        if key in pending:
+            pending[key][2].append(c_node)
         else:
-            target_node = tree
-            target_attr = "body"
+            pending[key] = (target_node, target_attr, [c_node])
 
+    for target_node, target_attr, comments in pending.values():
         attr = getattr(target_node, target_attr)
-        attr.append(c_node)
-        attr.sort(key=lambda x: (x.end_lineno, isinstance(x, Comment)))
+        attr.extend(comments)
+        attr.sort(key=lambda x: (x.end_lineno, getattr(x, "_comment_tag", 0)))
 
         # NOTE:
         # Due to some issues it's possible for comment nodes to go outside of their initial place
@@ -103,74 +146,249 @@ def _enrich(source: _t.Union[str, bytes], tree: ast.AST) -> None:
         # - https://github.com/t3rn0/ast-comments/issues/10
         # - https://github.com/t3rn0/ast-comments/issues/13
         for left, right in zip(attr[:-1], attr[1:]):
-            if isinstance(left, Comment) and isinstance(right, Comment):
+            # Comment is a leaf class, so an identity check beats isinstance here
+            if type(left) is Comment is type(right):
                 right.inline = False
 
 
+# Collect a Comment node for every comment in the source. Instead of running the
+# full tokenizer just to throw away everything but COMMENT tokens, scan the lines
+# directly and track only the string-literal state needed to tell a real comment
+# from a '#' inside a literal. Sources that may contain f-strings keep using the
+# tokenizer, since their replacement fields can legally contain '#'.
+def _extract_comments(source: str, lines: _t.List[str]) -> _t.List[Comment]:
+    if _FSTRING_RE.search(source):
+        return _tokenize_comments(lines)
+
+    comment_nodes = []
+    in_string = False
+    delim = ""
+    for lineno in range(1, len(lines)):
+        line = lines[lineno]
+        n = len(line)
+        i = 0
+        continued = False
+        while i < n:
+            ch = line[i]
+            if in_string:
+                if ch == "\\":
+                    if i + 1 >= n:
+                        continued = True
+                    i += 2
+                elif line.startswith(delim, i):
+                    in_string = False
+                    i += len(delim)
+                else:
+                    i += 1
+            elif ch == "#":
+                value = line[i:]
+                if value.endswith("\r"):
+                    value = value[:-1]
+                comment_nodes.append(
+                    Comment(
+                        value=value,
+                        # inline iff something other than whitespace precedes the '#'
+                        inline=bool(line[:i].strip()),
+                        lineno=lineno,
+                        col_offset=i,
+                        end_lineno=lineno,
+                        end_col_offset=i + len(value),
+                    )
+                )
+                break
+            elif ch == "'" or ch == '"':
+                in_string = True
+                if line.startswith(ch * 3, i):
+                    delim = ch * 3
+                    i += 3
+                else:
+                    delim = ch
+                    i += 1
+            else:
+                i += 1
+        if in_string and len(delim) == 1 and not continued:
+            # Only backslash-continued single-quoted strings span lines; the source
+            # already parsed successfully, so the literal ended on this line
+            in_string = False
+    return comment_nodes
+
+
+def _tokenize_comments(lines: _t.List[str]) -> _t.List[Comment]:
+    # Reuse the lines already split in _enrich (minus the sentinel) rather than
+    # re-splitting the source; restoring the newline per line is cheaper than a
+    # second full pass over the string, and tokenize tolerates one on the last line
+    lines_iter = (line + "\n" for line in lines[1:])
+    tokens = tokenize.generate_tokens(lambda: next(lines_iter))
+
+    comment_nodes = []
+    comment_type = tokenize.COMMENT
+    for t in tokens:
+        if t.type != comment_type:
+            continue
+        lineno, col_offset = t.start
+        end_lineno, end_col_offset = t.end
+        c = Comment(
+            value=t.string,
+            inline=bool(t.line[:col_offset].strip()),
+            lineno=lineno,
+            col_offset=col_offset,
+            end_lineno=end_lineno,
+            end_col_offset=end_col_offset,
+        )
+        comment_nodes.append(c)
+    return comment_nodes
+
+
+# Find the node (and the name of its container attribute) a comment at the given line
+# belongs to. Comments outside of every interval go to the module body.
+def _find_target(
+    c_lineno: int,
+    tree: ast.AST,
+    bounds: _t.List[_t.Tuple[int, int, int]],
+    records: _t.List[_t.Dict[str, _t.Union[_t.List[_t.Tuple[int, int, str]], ast.AST]]],
+) -> _t.Tuple[ast.AST, str]:
+    # The best interval is the one containing c_lineno with the largest lower bound
+    # and, among those, the smallest upper bound; intervals identical in both keep
+    # the later-walked (deeper) node. Since bounds is ordered by (low, high, walk
+    # order), scanning right-to-left from the last interval starting at or before
+    # c_lineno finds it without touching intervals that start further down.
+    idx = bisect.bisect_right(bounds, (c_lineno + 1,)) - 1
+    best = None
+    for i in range(idx, -1, -1):
+        x, y, order = bounds[i]
+        if best is not None and x < best[0]:
+            break
+        if y < c_lineno:
+            continue
+        if best is None or y < best[1] or (y == best[1] and order > best[2]):
+            best = (x, y, order)
+
+    if best is None:
+        return tree, "body"
+
+    target_interval = records[best[2]]
+
+    target_node = target_interval["node"]
+    # intervals for every attribute from _CONTAINER_ATTRS for the target node
+    sub_intervals = target_interval["intervals"]
+
+    loc = -1
+    for i, (low, high, _) in enumerate(sub_intervals):
+        if low <= c_lineno <= high or c_lineno < low:
+            loc = i
+            break
+
+    *_, target_attr = sub_intervals[loc]
+    return target_node, target_attr
+
+
 def _get_tree_intervals_and_update_ast_nodes(
-    node: ast.AST, source: str
-) -> _t.Dict[
-    _t.Tuple[int, int], _t.Dict[str, _t.Union[_t.List[_t.Tuple[int, int]], ast.AST]]
+    node: ast.AST,
+    lines: _t.List[str],
+    indents: "array.array",
+    is_comment: bytearray,
+    next_dedent: "array.array",
+) -> _t.Tuple[
+    _t.List[_t.Tuple[int, int, int]],
+    _t.List[_t.Dict[str, _t.Union[_t.List[_t.Tuple[int, int, str]], ast.AST]]],
 ]:
-    res = {}
-    for node in ast.walk(node):
+    bounds = []
+    records = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        # AST nodes keep their fields in the instance dict; going through it directly
+        # is cheaper than a getattr with default per container attribute
+        node_dict = node.__dict__
         attr_intervals = []
         for attr in _CONTAINER_ATTRS:
-            if items := getattr(node, attr, None):
-                if not isinstance(items, Iterable):
-                    continue
+            items = node_dict.get(attr)
+            if items and isinstance(items, list):
                 attr_intervals.append(
-                    (*_extend_interval(_get_interval(items), source), attr)
+                    (
+                        *_extend_interval(
+                            _get_interval(items),
+                            lines,
+                            indents,
+                            is_comment,
+                            next_dedent,
+                        ),
+                        attr,
+                    )
                 )
         if attr_intervals:
             # If the parent node hast lineno and end_lineno we extend them too, because there
             # could be comments at the end not covered by the intervals gathered in the attributes
-            if hasattr(node, "lineno") and hasattr(node, "end_lineno"):
-                low, high = _extend_interval((node.lineno, node.end_lineno), source)
+            if "lineno" in node_dict and "end_lineno" in node_dict:
+                low, high = _extend_interval(
+                    (node_dict["lineno"], node_dict["end_lineno"]),
+                    lines,
+                    indents,
+                    is_comment,
+                    next_dedent,
+                )
                 node.lineno = low
                 node.end_lineno = high
                 # also update the end col offset corresponding to the new line
-                node.end_col_offset = len(source.split("\n")[high - 1])
+                node.end_col_offset = len(lines[high])
             else:
                 low = (
-                    min(node.lineno, min(attr_intervals)[0])
-                    if hasattr(node, "lineno")
+                    min(node_dict["lineno"], min(attr_intervals)[0])
+                    if "lineno" in node_dict
                     else min(attr_intervals)[0]
                 )
                 high = (
-                    max(node.end_lineno, max(attr_intervals)[1])
-                    if hasattr(node, "end_lineno")
+                    max(node_dict["end_lineno"], max(attr_intervals)[1])
+                    if "end_lineno" in node_dict
                     else max(attr_intervals)[1]
                 )
 
-            res[(low, high)] = {"intervals": attr_intervals, "node": node}
-    return res
+            # Distinct nodes may share identical bounds (e.g. single-line compound
+            # statements); keeping the walk order in the tuple keeps them apart
+            # and lets _find_target prefer the deeper one
+            bounds.append((low, high, len(records)))
+            records.append({"intervals": attr_intervals, "node": node})
+
+        # Push the children directly from the already-fetched dict; this fuses the
+        # traversal with the container scan instead of re-iterating the fields
+        # through ast.iter_child_nodes
+        for value in node_dict.values():
+            if isinstance(value, ast.AST):
+                stack.append(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        stack.append(item)
+
+    bounds.sort()
+    return bounds, records
 
 
 # Try to move lower bound lower and upper bound higher while not going out of bounds concerning
 # the current block. The method is based on indentation levels to find the correct upper and lower
 # bounds of the interval looked at by checking where the indentation changes, and it marks the end
 # of the interval
-def _extend_interval(interval: _t.Tuple[int, int], code: str) -> _t.Tuple[int, int]:
-    lines = code.split("\n")
-    # Insert an empty line to correspond to the lineno values from ast nodes which start at 1
-    # instead of 0
-    lines.insert(0, "")
-
+def _extend_interval(
+    interval: _t.Tuple[int, int],
+    lines: _t.List[str],
+    indents: "array.array",
+    is_comment: bytearray,
+    next_dedent: "array.array",
+) -> _t.Tuple[int, int]:
     low = interval[0]
     high = interval[1]
     skip_lower = False
 
     if low == high:
         # Covering inner blocks like the inside of an if block consisting of only one line
-        start_indentation = _get_indentation_lvl(lines[low])
+        start_indentation = indents[low]
     else:
         # Covering cases of blocks starting at an outer term like 'if' and blocks with more than
         # one line
-        lower_bound = _get_indentation_lvl(lines[low])
+        lower_bound = indents[low]
         start_indentation = max(
             lower_bound,
-            _get_indentation_lvl(_get_first_line_not_comment(lines[low + 1 :])),
+            indents[_get_first_line_not_comment(lines, is_comment, low + 1)],
         )
         if start_indentation != lower_bound:
             skip_lower = True
@@ -179,49 +397,64 @@ def _extend_interval(interval: _t.Tuple[int, int], code: str) -> _t.Tuple[int, i
         # The upper bound ignores comments which are not correctly aligned, due to the fact
         # that there must always be an ast node other than a comment one with a lower indentation
         # above
-        if re.match(
-            r"^ *#.*", lines[low - 1]
-        ) or start_indentation <= _get_indentation_lvl(lines[low - 1]):
+        if is_comment[low - 1] or start_indentation <= indents[low - 1]:
             low -= 1
         else:
             break
 
-    while high + 1 < len(lines):
-        if start_indentation <= _get_indentation_lvl(lines[high + 1]):
-            high += 1
-        else:
-            break
+    # Whenever a line stays at or above start_indentation, every line up to its
+    # next dedent does too, so the upper bound can jump instead of stepping
+    n = len(lines)
+    j = high + 1
+    while j < n and start_indentation <= indents[j]:
+        j = next_dedent[j]
+    high = j - 1
 
     return low, high
 
 
-# Searches for the first line not being a comment
+# Searches for the index of the first line not being a comment, starting at `start`
 # In each block there must be at least one, otherwise the code is not valid
-def _get_first_line_not_comment(lines: _t.List[str]):
-    for line in lines:
-        if not line.strip():
+# Index 0 (the sentinel empty line) is returned if there is none
+def _get_first_line_not_comment(
+    lines: _t.List[str], is_comment: bytearray, start: int
+) -> int:
+    for i in range(start, len(lines)):
+        if not lines[i].strip():
             continue
-        if not re.match(r"^ *#.*", line):
-            return line
-    return ""
+        if not is_comment[i]:
+            return i
+    return 0
+
 
+# For every line index the first following index with a strictly smaller
+# indentation, or len(indents) if there is none; built with a monotonic stack
+def _compute_next_dedent(indents: "array.array") -> "array.array":
+    n = len(indents)
+    next_dedent = array.array("i", [n] * n)
+    stack = []
+    for i in range(n):
+        while stack and indents[i] < indents[stack[-1]]:
+            next_dedent[stack.pop()] = i
+        stack.append(i)
+    return next_dedent
 
-def _get_indentation_lvl(line: str) -> int:
-    line.replace("\t", "   ")
-    res = re.findall(r"^ *", line)
-    indentation = 0
-    if len(res) > 0:
-        indentation = len(res[0])
-    return indentation
+
+def _compute_indent(line: str) -> int:
+    line = line.replace("\t", "   ")
+    return len(line) - len(line.lstrip(" "))
 
 
 # get min and max line from a source tree
 def _get_interval(items: _t.List[ast.AST]) -> _t.Tuple[int, int]:
-    linenos, end_linenos = [], []
-    for item in items:
-        linenos.append(item.lineno)
-        end_linenos.append(item.end_lineno)
-    return min(linenos), max(end_linenos)
+    low = items[0].lineno
+    high = items[0].end_lineno
+    for item in items[1:]:
+        if item.lineno < low:
+            low = item.lineno
+        if item.end_lineno > high:
+            high = item.end_lineno
+    return low, high
 
 
 # `unparse` has been introduced in Python 3.9
@@ -237,31 +470,37 @@ if sys.version_info >= (3, 9):
         def visit_If(self, node: ast.If) -> None:
             def _get_first_not_comment_idx(orelse: list[ast.stmt]) -> int:
                 i = 0
-                while i < len(orelse) and isinstance(orelse[i], Comment):
+                while i < len(orelse) and type(orelse[i]) is Comment:
                     i += 1
                 return i
 
-            self.fill("if ")
-            self.traverse(node.test)
-            with self.block():
-                self.traverse(node.body)
+            # bound to locals: the elif loop below hits these once per branch
+            fill = self.fill
+            traverse = self.traverse
+            block = self.block
+
+            fill("if ")
+            traverse(node.test)
+            with block():
+                traverse(node.body)
             # collapse nested ifs into equivalent elifs.
             while node.orelse:
-                i = _get_first_not_comment_idx(node.orelse)
-                if len(node.orelse[i:]) != 1 or not isinstance(node.orelse[i], ast.If):
+                orelse = node.orelse
+                i = _get_first_not_comment_idx(orelse)
+                if len(orelse) - i != 1 or not isinstance(orelse[i], ast.If):
                     break
-                for c_node in node.orelse[:i]:
-                    self.traverse(c_node)
-                node = node.orelse[i]
-                self.fill("elif ")
-                self.traverse(node.test)
-                with self.block():
-                    self.traverse(node.body)
+                for c_node in orelse[:i]:
+                    traverse(c_node)
+                node = orelse[i]
+                fill("elif ")
+                traverse(node.test)
+                with block():
+                    traverse(node.body)
             # final else
             if node.orelse:
-                self.fill("else")
-                with self.block():
-                    self.traverse(node.orelse)
+                fill("else")
+                with block():
+                    traverse(node.orelse)
 
     def unparse(ast_obj: ast.AST) -> str:
         return _Unparser().visit(ast_obj)
@@ -270,11 +509,25 @@ if sys.version_info >= (3, 9):
 def pre_compile_fixer(tree: ast.AST) -> ast.AST:
     """
     The parse output from ast_comments cannot compile (see issue #23). This function can be
-    run to fix the output so that it can compile.  This transformer strips out Comment nodes.
+    run to fix the output so that it can compile.  It strips out Comment nodes.
     """
-
-    class RewriteComments(ast.NodeTransformer):
-        def visit_Comment(self, node: ast.AST) -> ast.AST:
-            return None
-
-    return RewriteComments().visit(tree)
+    # Comments only ever live in the container attributes, so a targeted sweep is
+    # enough - no need for the generic NodeTransformer re-traversal which repacks
+    # every field of every node. The walk still has to follow all children, since
+    # containers can sit behind non-container fields (e.g. match cases).
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        node_dict = node.__dict__
+        for attr in _CONTAINER_ATTRS:
+            items = node_dict.get(attr)
+            if items and isinstance(items, list):
+                node_dict[attr] = [x for x in items if type(x) is not Comment]
+        for value in node_dict.values():
+            if isinstance(value, ast.AST):
+                stack.append(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        stack.append(item)
+    return tree
@@ -0,0 +1,35 @@
+"""Shared fixtures for the test suite."""
+
+import copy
+from functools import lru_cache
+
+import pytest
+
+import ast_comments
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warm_up_parse():
+    """Run one tiny parse before the suite so one-time costs (module imports,
+    regex compilation) are not billed to whichever test happens to run first.
+    """
+    ast_comments.parse("x = 1  # c")
+
+
+@pytest.fixture(scope="session")
+def parse_cached():
+    """Memoizing wrapper around `ast_comments.parse` for plain-string sources.
+
+    Identical snippets show up in several tests (and across test files), so the
+    enriched tree is built once per source and handed out as a deep copy to keep
+    the tests isolated from each other.
+    """
+
+    @lru_cache(maxsize=None)
+    def _parse_once(source: str) -> ast_comments.AST:
+        return ast_comments.parse(source)
+
+    def _parse(source: str) -> ast_comments.AST:
+        return copy.deepcopy(_parse_once(source))
+
+    return _parse
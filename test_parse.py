@@ -2,147 +2,226 @@
 
 import ast
 import dis
-from textwrap import dedent
 
 import pytest
 
-from ast_comments import Comment, parse, pre_compile_fixer
-
-
-def test_compile_parse_output():
+from ast_comments import (
+    _PARSE_CACHE_MAXSIZE,
+    Comment,
+    _parse_cache,
+    _parse_cache_clear,
+    parse,
+    pre_compile_fixer,
+)
+
+# Sources are dedented once at import time instead of per test call.
+_SRC_COMPILE_WITH_COMMENTS = """
+func(1, 2)  # comment
+# Another comment
+x = 5 * "s"
+"""
+_SRC_COMPILE_WITHOUT_COMMENTS = """
+func(1, 2)
+
+x = 5 * "s"
+"""
+_SRC_COMMENT_AT_START_OF_INNER_BLOCK = """
+def test():
+    # Comment at start of block
+    hello = 'hello'
+"""
+_SRC_COMMENT_AT_START_WRONG_INDENTATION = """
+def test():
+# Comment at start of block
+    hello = 'hello'
+"""
+_SRC_COMMENT_AT_END_OF_INNER_BLOCK = """
+def test():
+    hello = 'hello'
+    # Comment at end of block
+"""
+_SRC_COMMENT_AT_END_WRONG_INDENTATION = """
+if 1 == 1:
+    hello = 'hello'
+# Comment at end of block
+else:
+    hello = 'hello'
+"""
+_SRC_COMMENT_ABOVE_SIBLING_CLASSES = """
+# header comment
+class A(Exception): pass
+class B(Exception): pass
+"""
+_SRC_SEPARATE_LINE_SINGLE = """
+# comment to hello
+hello = 'hello'
+"""
+_SRC_SEPARATE_LINE_MULTILINE = """
+# comment to hello 1
+# comment to hello 2
+hello = 'hello'
+"""
+_SRC_MULTILINE_AND_INLINE_COMBINED = """
+# comment to hello 1
+# comment to hello 2
+
+hello = 'hello' # comment to hello 3
+"""
+_SRC_UNRELATED_COMMENT = """
+hello = 'hello'
+# unrelated comment
+"""
+_SRC_COMMENT_TO_FUNCTION = """
+# comment to function 'foo'
+def foo(*args, **kwargs):
+    print(args, kwargs) # comment to print
+"""
+_SRC_COMMENT_TO_CLASS = """
+# comment to class 'Foo'
+class Foo:
+    var = "Foo var"    # comment to 'Foo.var'
+
+    # comment to method 'foo'
+    def foo(self):
+        ...
+"""
+_SRC_COMMENTS_TO_IF = """
+if a > b: # if comment
+    print('bigger')
+elif a == b: # elif comment
+    print('equal')
+else: # else comment
+    print('less')
+"""
+_SRC_COMMENTS_TO_FOR = """
+for i in range(10): # for comment
+    continue    # continue comment
+else:   # else comment
+    pass    # pass comment
+"""
+_SRC_COMMENTS_TO_TRY = """
+try:    # try comment
+    1 / 0   # expr comment
+except ValueError:  # except ValueError comment
+    pass    # pass comment
+except KeyError:    # except KeyError
+    pass    # pass comment
+else:   # else comment
+    print() # print comment
+finally:    # finally comment
+    print() # print comment
+"""
+_SRC_COMMENT_TO_MULTILINE_EXPR = """
+if a:
+    (b if b >=
+        0 else 1)    # some comment
+"""
+_SRC_EMPTY_LINE = """
+# comment 1
+if a:  # comment 2
+
+    pass
+"""
+_SRC_COMMENT_IN_MULTILINED_LIST = """
+lst = [
+    1  # comment to element
+]
+"""
+
+
+def test_compile_parse_output(parse_cached):
     """
     Output of `ast_comments.parse` can be compiled after applying the compile_fix helper function.
     The tree resulting from this compilation should be the same as the tree resulting from
     compiling the same code without comments.
     """
-    with_comments = dedent(
-        """
-        func(1, 2)  # comment
-        # Another comment
-        x = 5 * "s"
-        """
+    compiled_with = compile(
+        pre_compile_fixer(parse_cached(_SRC_COMPILE_WITH_COMMENTS)), "<string>", "exec"
     )
-    without_comments = dedent(
-        """
-        func(1, 2)
-
-        x = 5 * "s"
-        """
+    compiled_without = compile(
+        parse_cached(_SRC_COMPILE_WITHOUT_COMMENTS), "<string>", "exec"
     )
 
-    compiled_with = compile(pre_compile_fixer(parse(with_comments)), "<string>", "exec")
-    compiled_without = compile(parse(without_comments), "<string>", "exec")
-
     assert list(dis.get_instructions(compiled_with)) == list(
         dis.get_instructions(compiled_without)
     )
 
 
-def test_comment_at_start_of_inner_block_getting_correctly_parsed():
-    """Comment at the start of a new inlined block/interval"""
-    source = dedent(
-        """
-        def test():
-            # Comment at start of block
-            hello = 'hello'
-        """
-    )
-    nodes = parse(source).body
-    assert isinstance(nodes[0].body[0], Comment)
-
-
-def test_comment_at_start_of_inner_block_with_wrong_indentation_is_still_inside_the_block():
-    """Comment at the start of a new inlined block/interval with wrong indentation"""
-    source = dedent(
-        """
-        def test():
-        # Comment at start of block
-            hello = 'hello'
-        """
-    )
-    nodes = parse(source).body
+@pytest.mark.parametrize(
+    "source",
+    [_SRC_COMMENT_AT_START_OF_INNER_BLOCK, _SRC_COMMENT_AT_START_WRONG_INDENTATION],
+    ids=["correct_indentation", "wrong_indentation"],
+)
+def test_comment_at_start_of_inner_block_getting_correctly_parsed(parse_cached, source):
+    """Comment at the start of a new inlined block/interval stays inside the block,
+    even with wrong indentation.
+    """
+    nodes = parse_cached(source).body
     assert isinstance(nodes[0].body[0], Comment)
 
 
-def test_comment_at_end_of_inner_block_getting_correctly_parsed():
+def test_comment_at_end_of_inner_block_getting_correctly_parsed(parse_cached):
     """Comment at the end of a new inlined block/interval"""
-    source = dedent(
-        """
-        def test():
-            hello = 'hello'
-            # Comment at end of block
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENT_AT_END_OF_INNER_BLOCK).body
     assert isinstance(nodes[0].body[1], Comment)
 
 
-def test_comment_at_end_of_inner_block_with_wrong_indentation_gets_moved_to_next_block():
+def test_comment_at_end_of_inner_block_with_wrong_indentation_gets_moved_to_next_block(
+    parse_cached,
+):
     """Comment at the end of a new inlined block/interval with wrong indentation should get assigned
     to next block
     """
-    source = dedent(
-        """
-        if 1 == 1:
-            hello = 'hello'
-        # Comment at end of block
-        else:
-            hello = 'hello'
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENT_AT_END_WRONG_INDENTATION).body
     assert isinstance(nodes[0].orelse[0], Comment)
 
 
-def test_single_comment_in_tree():
-    """Parsed tree has Comment node."""
-    source = """# comment"""
-    nodes = parse(source).body
+def test_comment_above_sibling_blocks_goes_to_first_block(parse_cached):
+    """When two single-line sibling blocks both absorb the comment line above them,
+    the comment lands in the body of the first sibling.
+    """
+    nodes = parse_cached(_SRC_COMMENT_ABOVE_SIBLING_CLASSES).body
+    assert len(nodes) == 2
+    assert isinstance(nodes[0].body[0], Comment)
+    assert nodes[0].body[0].value == "# header comment"
+    assert not any(isinstance(node, Comment) for node in nodes[1].body)
+
+
+@pytest.mark.parametrize(
+    "source",
+    ["""# comment""", """# comment """],
+    ids=["plain", "trailing_space"],
+)
+def test_single_comment_in_tree(parse_cached, source):
+    """Parsed tree has Comment node. Spaces at the end of a comment does not change
+    its inlined value.
+    """
+    nodes = parse_cached(source).body
     assert len(nodes) == 1
     assert isinstance(nodes[0], Comment)
     assert not nodes[0].inline
 
 
-def test_comment_ends_with_space():
-    """Spaces at the end of a comment does not change its inlined value."""
-    source = """# comment """
-    nodes = parse(source).body
-    assert not nodes[0].inline
-
-
-def test_separate_line_single_line():
+def test_separate_line_single_line(parse_cached):
     """Comment to the following line. Order in which nodes appears is preserved."""
-    source = dedent(
-        """
-        # comment to hello
-        hello = 'hello'
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_SEPARATE_LINE_SINGLE).body
     assert len(nodes) == 2
     assert isinstance(nodes[0], Comment)
     assert not nodes[0].inline
 
 
-def test_inline_comment_after_statement():
+def test_inline_comment_after_statement(parse_cached):
     """Inlined comment goes after statement."""
     source = """hello = 'hello' # comment to hello"""
-    nodes = parse(source).body
+    nodes = parse_cached(source).body
     assert len(nodes) == 2
     assert isinstance(nodes[1], Comment)
     assert nodes[1].inline
 
 
-def test_separate_line_multiline():
+def test_separate_line_multiline(parse_cached):
     """Multiple comments to the following line."""
-    source = dedent(
-        """
-        # comment to hello 1
-        # comment to hello 2
-        hello = 'hello'
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_SEPARATE_LINE_MULTILINE).body
     assert len(nodes) == 3
     assert isinstance(nodes[0], Comment)
     assert isinstance(nodes[1], Comment)
@@ -152,17 +231,9 @@ def test_separate_line_multiline():
     assert not nodes[1].inline
 
 
-def test_multiline_and_inline_combined():
+def test_multiline_and_inline_combined(parse_cached):
     """Multiple comments to the following line combined with inline comment."""
-    source = dedent(
-        """
-        # comment to hello 1
-        # comment to hello 2
-
-        hello = 'hello' # comment to hello 3
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_MULTILINE_AND_INLINE_COMBINED).body
     assert nodes[0].value == "# comment to hello 1"
     assert not nodes[0].inline
     assert nodes[1].value == "# comment to hello 2"
@@ -171,30 +242,17 @@ def test_multiline_and_inline_combined():
     assert nodes[3].inline
 
 
-def test_unrelated_comment():
+def test_unrelated_comment(parse_cached):
     """Comment after statement"""
-    source = dedent(
-        """
-        hello = 'hello'
-        # unrelated comment
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_UNRELATED_COMMENT).body
     assert len(nodes) == 2
     assert isinstance(nodes[1], Comment)
     assert not nodes[1].inline
 
 
-def test_comment_to_function():
+def test_comment_to_function(parse_cached):
     """Comments to function and expression inside."""
-    source = dedent(
-        """
-        # comment to function 'foo'
-        def foo(*args, **kwargs):
-            print(args, kwargs) # comment to print
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENT_TO_FUNCTION).body
     assert len(nodes) == 2
     assert nodes[0].value == "# comment to function 'foo'"
     assert not nodes[0].inline
@@ -203,20 +261,9 @@ def test_comment_to_function():
     assert function_node.body[1].inline
 
 
-def test_comment_to_class():
+def test_comment_to_class(parse_cached):
     """Comments to class, its method and variable."""
-    source = dedent(
-        """
-        # comment to class 'Foo'
-        class Foo:
-            var = "Foo var"    # comment to 'Foo.var'
-
-            # comment to method 'foo'
-            def foo(self):
-                ...
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENT_TO_CLASS).body
 
     assert len(nodes) == 2
     assert nodes[0].value == "# comment to class 'Foo'"
@@ -244,17 +291,17 @@ def test_parse_ast():
     assert parse(ast.parse(source))
 
 
-def test_multiple_statements_in_line():
+def test_multiple_statements_in_line(parse_cached):
     """It's possible to parse multiple statements in one line."""
     source = """hello = 'hello'; hello += ' world?'"""
-    tree = parse(source)
+    tree = parse_cached(source)
     assert len(tree.body) == 2
 
 
-def test_comment_to_multiple_statements():
+def test_comment_to_multiple_statements(parse_cached):
     """Comment goes behind statements."""
     source = """a=1; b=2 # hello"""
-    nodes = parse(source).body
+    nodes = parse_cached(source).body
     assert len(nodes) == 3
     assert isinstance(nodes[0], ast.Assign)
     assert isinstance(nodes[1], ast.Assign)
@@ -262,19 +309,9 @@ def test_comment_to_multiple_statements():
     assert nodes[2].inline
 
 
-def test_comments_to_if():
+def test_comments_to_if(parse_cached):
     """Comments to if/elif/else blocks."""
-    source = dedent(
-        """
-        if a > b: # if comment
-            print('bigger')
-        elif a == b: # elif comment
-            print('equal')
-        else: # else comment
-            print('less')
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENTS_TO_IF).body
     assert len(nodes) == 1  # IF node
     body_nodes = nodes[0].body
     assert len(body_nodes) == 2
@@ -297,17 +334,9 @@ def test_comments_to_if():
     assert isinstance(orelse_else_nodes[1], ast.Expr)
 
 
-def test_comments_to_for():
+def test_comments_to_for(parse_cached):
     """Comments to for/else blocks."""
-    source = dedent(
-        """
-        for i in range(10): # for comment
-            continue    # continue comment
-        else:   # else comment
-            pass    # pass comment
-        """
-    )
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENTS_TO_FOR).body
     assert len(nodes) == 1  # FOR node
     body_nodes = nodes[0].body
     assert len(body_nodes) == 3
@@ -322,24 +351,9 @@ def test_comments_to_for():
     assert isinstance(orelse_nodes[2], Comment)
 
 
-def test_comments_to_try():
+def test_comments_to_try(parse_cached):
     """Comments to try/except/else/finally blocks."""
-    source = dedent(
-        """
-        try:    # try comment
-            1 / 0   # expr comment
-        except ValueError:  # except ValueError comment
-            pass    # pass comment
-        except KeyError:    # except KeyError
-            pass    # pass comment
-        else:   # else comment
-            print() # print comment
-        finally:    # finally comment
-            print() # print comment
-        """
-    )
-
-    nodes = parse(source).body
+    nodes = parse_cached(_SRC_COMMENTS_TO_TRY).body
     assert len(nodes) == 1  # TRY node
     body_nodes = nodes[0].body
     assert len(body_nodes) == 3
@@ -369,16 +383,9 @@ def test_comments_to_try():
     assert isinstance(finalbody_nodes[2], Comment)
 
 
-def test_comment_to_multiline_expr():
+def test_comment_to_multiline_expr(parse_cached):
     """Comment to multilined expr goes first."""
-    source = dedent(
-        """
-        if a:
-            (b if b >=
-                0 else 1)    # some comment
-        """
-    )
-    if_node = parse(source).body[0]
+    if_node = parse_cached(_SRC_COMMENT_TO_MULTILINE_EXPR).body[0]
     body_nodes = if_node.body
     assert len(body_nodes) == 2
     assert isinstance(body_nodes[0], ast.Expr)
@@ -386,17 +393,9 @@ def test_comment_to_multiline_expr():
     assert body_nodes[1].inline
 
 
-def test_empty_line_not_affect_comment_placement():
+def test_empty_line_not_affect_comment_placement(parse_cached):
     """Empty line doesn't mess with indendation intervals."""
-    source = dedent(
-        """
-        # comment 1
-        if a:  # comment 2
-
-            pass
-        """
-    )
-    body = parse(source).body
+    body = parse_cached(_SRC_EMPTY_LINE).body
     assert len(body) == 2
     assert isinstance(body[0], Comment)
     if_body = body[1].body
@@ -404,13 +403,36 @@ def test_empty_line_not_affect_comment_placement():
 
 
 @pytest.mark.xfail(reason="https://github.com/t3rn0/ast-comments/issues/13")
-def test_comment_in_multilined_list():
+def test_comment_in_multilined_list(parse_cached):
     """Comment to element of the list stays inside the list."""
-    source = dedent(
-        """
-        lst = [
-            1  # comment to element
-        ]
-        """
-    )
-    assert len(parse(source).body) == 1
+    assert len(parse_cached(_SRC_COMMENT_IN_MULTILINED_LIST).body) == 1
+
+
+def test_parse_cache_returns_equal_isolated_trees():
+    """`cache=True` gives the same tree as a plain parse, and mutating a returned
+    tree doesn't poison the cached copy.
+    """
+    source = """hello = 'hello' # comment to hello"""
+    _parse_cache_clear()
+    tree = parse(source, cache=True)
+    assert ast.dump(tree) == ast.dump(parse(source))
+    tree.body[1].value = "# changed"
+    assert parse(source, cache=True).body[1].value == "# comment to hello"
+
+
+def test_parse_cache_bypassed_with_extra_args():
+    """Extra positional/keyword arguments fall back to the uncached path."""
+    source = """hello = 'hello' # comment to hello"""
+    _parse_cache_clear()
+    tree = parse(source, "<test>", cache=True)
+    assert ast.dump(tree) == ast.dump(parse(source))
+    assert source not in _parse_cache
+
+
+def test_parse_cache_evicts_least_recently_used():
+    """The cache never grows past its maxsize; the oldest entry goes first."""
+    _parse_cache_clear()
+    for i in range(_PARSE_CACHE_MAXSIZE + 1):
+        parse(f"x = {i}  # c", cache=True)
+    assert len(_parse_cache) == _PARSE_CACHE_MAXSIZE
+    assert "x = 0  # c" not in _parse_cache